@@ -3,11 +3,12 @@ from __future__ import annotations
 import os
 import os.path
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from enum import StrEnum, IntEnum
 from pathlib import Path
-from typing import Sequence
+from typing import Callable, Sequence
 
-from py_util import flatten, group_by
+from py_util import group_by
 from stats import Stats
 
 
@@ -42,17 +43,36 @@ class ExcludeDirMode(IntEnum):
 
 
 class AbstractExclude(ABC):
+    # __slots__ everywhere on the decl classes: users may have 1000s of these
+    #  and it makes attribute access (the hot part) a bit faster
+    __slots__ = ()
+
+    # Class-level flags so the walk can partition excludes with a plain
+    #  attribute load instead of isinstance() (ABCMeta's __instancecheck__
+    #  is surprisingly slow)
+    IS_FILE_EXCLUDE = False
+    IS_DIR_EXCLUDE = False
+
     @abstractmethod
-    def should_exclude(self, path: Path, /, fs_type: FsType) -> bool:
+    def should_exclude(self, path: Path, /, fs_type: FsType,
+                       name: str | None = None) -> bool:
+        """``name``, if given, must equal ``path.name``; callers that already
+        have the basename as a str pass it to skip the ``Path.name`` walk."""
         return False
 
 
 class AbstractFileExclude(AbstractExclude, ABC):
     """Exclude a file"""
+    __slots__ = ()
+
+    IS_FILE_EXCLUDE = True
 
 
 class AbstractDirExclude(AbstractExclude, ABC):
     """Exclude dir itself (and contents)"""
+    __slots__ = ('keep_self',)
+
+    IS_DIR_EXCLUDE = True
 
     def __init__(self, keep_self: bool = False):
         self.keep_self = keep_self
@@ -62,35 +82,51 @@ class AbstractDirExclude(AbstractExclude, ABC):
         any of the contents. Only called if should_exclude() is True."""
         return self.keep_self
 
-    def exclude_mode_for(self, path: Path, fs_type: FsType):
+    def exclude_mode_for(self, path: Path, fs_type: FsType,
+                         name: str | None = None):
         assert fs_type == FsType.DIR
-        if not self.should_exclude(path, fs_type):
+        if not self.should_exclude(path, fs_type, name):
             return ExcludeDirMode.NO
+        if self.should_keep_self():
+            return ExcludeDirMode.CONTENTS
+        return ExcludeDirMode.ALL
 
 
 class FileExtExclude(AbstractFileExclude):
+    __slots__ = ('extensions',)
+
     def __init__(self, *ext: str):
         self.extensions = {e.removeprefix('.') for e in ext}
 
-    def should_exclude(self, file: Path, /, fs_type: FsType) -> bool:
-        _name, _, ext = file.name.rpartition('.')  # faster than the builtin .suffix!
+    def should_exclude(self, file: Path, /, fs_type: FsType,
+                       name: str | None = None) -> bool:
+        if name is None:
+            name = file.name
+        _stem, _, ext = name.rpartition('.')  # faster than the builtin .suffix!
         return ext in self.extensions
 
 
 class NameExclude(AbstractFileExclude, AbstractDirExclude):
+    __slots__ = ('names', 'fs_type')
+
     def __init__(self, *names: str, fs_type: FsType | None = None,
                  keep_self: bool = False):
         AbstractDirExclude.__init__(self, keep_self)
         self.names = set(names)
         self.fs_type = fs_type
 
-    def should_exclude(self, path: Path, /, fs_type: FsType) -> bool:
-        if self.fs_type is not None and not self.fs_type.matches_path(path):
+    def should_exclude(self, path: Path, /, fs_type: FsType,
+                       name: str | None = None) -> bool:
+        # Caller tells us the fs type (it knows it from the walk) - don't
+        #  re-derive it via matches_path, that'd be 2 stat syscalls per call
+        if self.fs_type is not None and self.fs_type != fs_type:
             return False
-        return path.name in self.names
+        return (path.name if name is None else name) in self.names
 
 
 class AbstractInclude(ABC):
+    __slots__ = ()
+
     # Quite a minimal API so implementors have to decide
     # how to go about finding the paths of interest
     @abstractmethod
@@ -100,13 +136,17 @@ class AbstractInclude(ABC):
 
 class AbstractFileInclude(AbstractInclude, ABC):
     """Include a file"""
+    __slots__ = ()
 
 
 class AbstractDirInclude(AbstractInclude, ABC):
     """Include a dir"""
+    __slots__ = ()
 
 
 class PathInclude(AbstractFileInclude, AbstractDirInclude):
+    __slots__ = ('paths',)
+
     def __init__(self, *paths: Path):
         self.paths = paths
 
@@ -114,12 +154,77 @@ class PathInclude(AbstractFileInclude, AbstractDirInclude):
         return self.paths
 
 
+DEFAULT_WALK_THREADS = min(32, (os.cpu_count() or 1) * 4)
+"""Default thread count for the directory walk. The walk is syscall-bound
+(readdir/stat latency, GIL released), not CPU-bound, so oversubscribe."""
+
+
+class _CompiledExcludes:
+    """The per-file exclude check, pre-compiled for one ``_walk`` pass.
+
+    Folds every ``FileExtExclude`` and every file-applicable ``NameExclude``
+    into two plain ``set``s so checking a file is O(1) set lookups instead of
+    an O(n_excludes) scan with a method call per exclude. Exclude types we
+    can't fold (subclasses etc.) go into ``other`` and are checked the old,
+    linear way after the sets miss.
+
+    ``should_exclude_file`` is a closure specialized to the actual excludes
+    (built in ``_build_matcher``): the sets are bound as locals and branches
+    that can't apply (no excludes at all / no unfoldable ones) are compiled
+    out entirely, so the per-file cost is as close to the bare set lookups
+    as pure Python gets."""
+    __slots__ = ('ext_set', 'name_set', 'other', 'should_exclude_file')
+
+    def __init__(self, excludes: Sequence[AbstractExclude]):
+        self.ext_set: set[str] = set()
+        self.name_set: set[str] = set()
+        self.other: list[AbstractFileExclude] = []
+        for e in excludes:
+            if not e.IS_FILE_EXCLUDE:
+                continue
+            # Exact type checks: a subclass may override should_exclude
+            #  so we can only fold the classes we know the semantics of
+            if type(e) is FileExtExclude:
+                self.ext_set |= e.extensions
+            elif type(e) is NameExclude:
+                if e.fs_type is None or e.fs_type == FsType.FILE:
+                    self.name_set |= e.names
+                # else: dir-only NameExclude can never exclude a file
+            else:
+                self.other.append(e)
+        self.should_exclude_file: Callable[[str, str], bool] = \
+            self._build_matcher()
+
+    def _build_matcher(self) -> Callable[[str, str], bool]:
+        """Matchers take ``(name, path_str)`` - plain strings straight from
+        the ``DirEntry``, so no ``Path`` is ever built for an excluded file."""
+        name_set, ext_set, other = self.name_set, self.ext_set, self.other
+        if not name_set and not ext_set and not other:
+            return lambda name, path_str: False  # Nothing can ever be excluded
+        if not other:  # Common case: everything folded into the sets
+            def matcher(name: str, path_str: str) -> bool:
+                return name in name_set or name.rpartition('.')[2] in ext_set
+            return matcher
+
+        def matcher(name: str, path_str: str) -> bool:
+            if name in name_set or name.rpartition('.')[2] in ext_set:
+                return True
+            path = Path(path_str)  # `other` excludes still take a Path
+            for e in other:
+                if e.should_exclude(path, FsType.FILE, name):
+                    return True
+            return False
+        return matcher
+
+
 class ListFiles:
     """NOTE: decls has later overrides earlier in all cases.
     It must also start with an include block (exclude would be useless
     at the start as it only excludes from the stuff before it)"""
-    def __init__(self, *decls: AbstractInclude | AbstractExclude):
+    def __init__(self, *decls: AbstractInclude | AbstractExclude,
+                 n_threads: int = None):
         self.decls: list[AbstractInclude | AbstractExclude] = list(decls)
+        self.n_threads = DEFAULT_WALK_THREADS if n_threads is None else n_threads
         self.stats = Stats()
         self.dirs: set[Path] = set()
         """^ WARNING: this won't add the contents/files in each of these,
@@ -128,9 +233,15 @@ class ListFiles:
 
     def list_files(self):
         include_blocks, exclude_blocks = self._group_declarations()
+        # Build the "excludes that apply to include block i" lists from the
+        #  end (suffix[i] = block[i] + suffix[i+1]) rather than re-merging
+        #  the whole tail per include block, which was O(blocks^2)
+        suffix: list[list[AbstractExclude]] = [[]] * (len(exclude_blocks) + 1)
+        for i in range(len(exclude_blocks) - 1, -1, -1):
+            suffix[i] = exclude_blocks[i] + suffix[i + 1]
         for i, includes in enumerate(include_blocks):  # For each include,
-            excludes = flatten(exclude_blocks[i:])  # Use the excludes below it
-            self._walk(includes, excludes)  # And add `includes - excludes_below_it`
+            excludes = suffix[min(i, len(exclude_blocks))]  # excludes below it
+            self._walk(includes, excludes)  # add `includes - excludes_below_it`
 
     _IEBlocksTup = tuple[list[list[AbstractInclude]], list[list[AbstractExclude]]]
 
@@ -160,74 +271,190 @@ class ListFiles:
               excludes: Sequence[AbstractExclude]):
         """Lists all files and dirs, adding ``includes - excludes`` to self"""
         excludes = list(excludes)
+        file_excludes = _CompiledExcludes(excludes)
+        # Pre-split once so the per-dir loop doesn't isinstance() every
+        #  exclude for every directory (file side is in _CompiledExcludes)
+        dir_excludes = [e for e in excludes if e.IS_DIR_EXCLUDE]
         roots = set()
         for o in includes:
             for p in o.get_paths():
                 self._assert_not_exotic(p)
                 if p.is_file():
-                    self._add_file_with_excludes(excludes, p)
+                    if not file_excludes.should_exclude_file(p.name, str(p)):
+                        self.add_file(p)
                 else:
                     roots.add(p)
-        return self._walk_roots(roots, excludes)
+        return self._walk_roots(roots, dir_excludes, file_excludes)
 
-    def _walk_roots(self, roots: set[Path], excludes: list[AbstractExclude]):
-        visited_dirs: set[Path] = set()
+    def _walk_roots(self, roots: set[Path],
+                    dir_excludes: list[AbstractDirExclude],
+                    file_excludes: _CompiledExcludes):
+        root_strs = []
         for root in roots:
             assert root.is_dir(), "Cannot have a non-dir root in _walk"
-            for dir_str, dirs, files in os.walk(root.expanduser().resolve()):
-                dirpath = Path(dir_str).resolve()
-                if dirpath in visited_dirs:
-                    # Already visited this tree, don't visit children
-                    dirs.clear()
-                    continue
-                visited_dirs.add(dirpath)
-
-                excl_mode = self.get_dir_exclude_mode(excludes, dirpath)
-                if not excl_mode.exclude_self():
-                    self.add_dir_only(dirpath)
-                if excl_mode.exclude_contents():
-                    dirs.clear()  # Don't recurse into dirs
-                    continue  # Don't add content (skip the code below)
-
-                for file in files:
-                    self._add_file_with_excludes(excludes, dirpath / file)
-                # Don't do anything with the dirs here, will handle them
-                #  when os.walk() recursively goes into them (topdown)
-
-    def _add_file_with_excludes(self, excludes: list[AbstractExclude], file: Path):
-        assert file.is_file(), "Expected a file, not dir/exotic"
-        if not self.should_exclude_file(excludes, file):
-            self.add_file(file)
+            root_strs.append(str(root.expanduser().resolve()))
+        visited_dirs: set[str] = set()
+        # Files found by the walk are batched here and flushed once at the
+        #  end - saves 3 attribute read-modify-writes on Stats per file
+        pending_files: list[tuple[Path, os.stat_result]] = []
+        if self.n_threads > 1:
+            self._walk_roots_parallel(
+                root_strs, dir_excludes, file_excludes, visited_dirs,
+                pending_files)
+        else:
+            self._walk_roots_serial(
+                root_strs, dir_excludes, file_excludes, visited_dirs,
+                pending_files)
+        self.stats.add_files(pending_files)
+        self.files.update(f for f, _st in pending_files)
+
+    def _walk_roots_serial(self, root_strs: list[str],
+                           dir_excludes: list[AbstractDirExclude],
+                           file_excludes: _CompiledExcludes,
+                           visited_dirs: set[str],
+                           pending_files: list[tuple[Path, os.stat_result]]):
+        for root_str in root_strs:
+            for dir_str, dirs, files in self._scandir_walk(root_str):
+                if not self._handle_walked_dir(
+                        dir_str, files, dir_excludes, file_excludes,
+                        visited_dirs, pending_files):
+                    dirs.clear()  # Prune: don't descend into subdirs
+
+    def _walk_roots_parallel(self, root_strs: list[str],
+                             dir_excludes: list[AbstractDirExclude],
+                             file_excludes: _CompiledExcludes,
+                             visited_dirs: set[str],
+                             pending_files: list[tuple[Path, os.stat_result]]):
+        """Walk with ``self.n_threads`` workers overlapping the (GIL-releasing)
+        ``os.scandir`` syscalls; this is where all the walk's latency is.
+
+        Only the scans run on the workers - visited-dir de-dup, excludes and
+        stats all happen on this (coordinating) thread, so the shared state
+        needs no locking."""
+        with ThreadPoolExecutor(self.n_threads) as pool:
+            futures = {pool.submit(self._scan_dir, d): d for d in root_strs}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    dir_str = futures.pop(fut)
+                    scanned = fut.result()
+                    if scanned is None:
+                        continue
+                    subdirs, files = scanned
+                    if self._handle_walked_dir(
+                            dir_str, files, dir_excludes, file_excludes,
+                            visited_dirs, pending_files):
+                        for sub in subdirs:
+                            futures[pool.submit(self._scan_dir, sub)] = sub
+
+    def _handle_walked_dir(self, dir_str: str, files: list[os.DirEntry],
+                           dir_excludes: list[AbstractDirExclude],
+                           file_excludes: _CompiledExcludes,
+                           visited_dirs: set[str],
+                           pending_files: list[tuple[Path, os.stat_result]]
+                           ) -> bool:
+        """Process one scanned directory (dir itself + its files).
+        Returns whether the walk should descend into its subdirs."""
+        # De-dup on the (normcased) string: hashing one str is much cheaper
+        #  than hashing a Path, which re-derives its parts every time
+        visited_key = os.path.normcase(dir_str)
+        if visited_key in visited_dirs:
+            return False  # Already visited this tree, don't visit children
+        visited_dirs.add(visited_key)
+        # No .resolve() here: the roots were resolved once in _walk_roots and
+        #  the walk skips symlinks, so dir_str is already canonical - a
+        #  realpath syscall per directory would buy nothing.
+        dirpath = Path(dir_str)
+
+        # Common case of no dir excludes at all: skip the call per dir
+        excl_mode = (
+            self.get_dir_exclude_mode(
+                dir_excludes, dirpath, os.path.basename(dir_str))
+            if dir_excludes else ExcludeDirMode.NO)
+        if not excl_mode.exclude_self():
+            self.add_dir_only(dirpath)
+        if excl_mode.exclude_contents():
+            return False  # Don't add content, don't recurse into dirs
+
+        should_exclude = file_excludes.should_exclude_file
+        known_files = self.files
+        add_pending = pending_files.append
+        for entry in files:
+            if should_exclude(entry.name, entry.path):
+                continue  # Excluded files never even get a Path or a stat
+            path = Path(entry.path)
+            if path in known_files:
+                continue  # Already added by an earlier include block
+            # DirEntry.stat() is cached by scandir (on Windows; on
+            #  Linux it's one stat but saves the one in Stats)
+            add_pending((path, entry.stat(follow_symlinks=False)))
+        # Don't do anything with the subdirs here, will handle them
+        #  when the walk goes into them (topdown)
+        return True
+
+    def _scandir_walk(self, root: str):
+        """Like ``os.walk(root)`` (topdown) but yields the ``DirEntry`` objects
+        for the files and uses the fs type info that ``os.scandir`` caches on
+        them, so we don't need an extra ``stat`` syscall per entry.
+
+        As with ``os.walk``, the caller may prune the walk by clearing the
+        yielded ``subdirs`` list (we only descend after the ``yield``).
+        Exotic entries (e.g. symlinks) are skipped entirely.
+
+        Iterative (explicit stack) rather than recursive: a ``yield from``
+        chain costs one frame per directory *level* for every item yielded,
+        which adds up on deep trees."""
+        stack = [root]
+        pop = stack.pop
+        while stack:
+            dirpath = pop()
+            scanned = self._scan_dir(dirpath)
+            if scanned is None:
+                continue
+            subdirs, files = scanned
+            yield dirpath, subdirs, files
+            stack += subdirs
 
-    # noinspection PyMethodMayBeStatic
-    def should_exclude_file(self, excludes: list[AbstractExclude], file: Path):
-        for e in excludes:
-            if isinstance(e, AbstractFileExclude) and e.should_exclude(file, FsType.FILE):
-                return True
-        return False
+    @staticmethod
+    def _scan_dir(dirpath: str) -> tuple[list[str], list[os.DirEntry]] | None:
+        """Scan a single directory into (subdir paths, file entries),
+        or None if it can't be read (same as os.walk's default: ignore)."""
+        subdirs: list[str] = []
+        files: list[os.DirEntry] = []
+        add_subdir = subdirs.append
+        add_file = files.append
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        add_subdir(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        add_file(entry)
+        except OSError:
+            return None
+        return subdirs, files
 
     # noinspection PyMethodMayBeStatic
-    def get_dir_exclude_mode(self, excludes: list[AbstractExclude], path: Path):
+    def get_dir_exclude_mode(self, dir_excludes: list[AbstractDirExclude],
+                             path: Path, name: str | None = None):
         result = ExcludeDirMode.NO
-        for e in excludes:
-            if not isinstance(e, AbstractDirExclude):
-                continue
+        for e in dir_excludes:
             # Largest value (= largest amount excluded) wins
-            result = max(result, e.exclude_mode_for(path, FsType.DIR))
+            result = max(result, e.exclude_mode_for(path, FsType.DIR, name))
             if result == ExcludeDirMode.ALL:
                 # Excluding everything already, no need to go further
                 return result
         return result
 
-    def add_file(self, file: Path):
+    def add_file(self, file: Path, st: os.stat_result | None = None):
         if file in self.files:
             return
-        self.stats.add_file(file)
+        self.stats.add_file(file, st)
         self.files.add(file)
 
     def add_dir_only(self, path: Path):
         """WARNING: doesn't add children, only the dir itself"""
-        if path not in self.dirs:
+        if path in self.dirs:
             return
         self.stats.add_dir(path)
         self.dirs.add(path)
@@ -246,6 +473,11 @@ class ListFiles:
         assert path.is_file() or path.is_dir(), (
             "Exotic structures (e.g. symlinks) are not currently supported")
 
+# TODO: on Linux >= 5.6, the per-file statx calls during the walk could be
+#  batch-submitted through io_uring (IORING_OP_STATX, queue depth ~256) so the
+#  kernel resolves many in parallel - needs the `liburing` bindings or a small
+#  C extension so can't do it in pure stdlib Python; the thread pool in
+#  _walk_roots_parallel gets us part of the way there for now.
 # TODO: for intra-file progress bar (Windows API):
 #  https://learn.microsoft.com/en-us/windows/win32/api/winbase/nf-winbase-copyfile2,
 #  https://learn.microsoft.com/en-us/windows/win32/api/winbase/nf-winbase-copyfileexa
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import os
+import stat
+import sys
 from abc import ABC, abstractmethod
 from collections.abc import Sequence
+from concurrent.futures import Executor
 from enum import Flag
 from pathlib import Path, PurePath
 
-from py_util import assert_not_exotic, flatten
+from py_util import assert_not_exotic, flatten_lists
 
 
 class FsTypeFlag(Flag):
@@ -14,17 +18,99 @@ class FsTypeFlag(Flag):
     BOTH = FILE | DIR
 
     @classmethod
-    def from_path(cls, p: Path):
-        if p.is_file():
+    def from_path(cls, p: Path, st_mode: int | None = None):
+        """One ``stat`` syscall, not the two of an ``is_file()``/``is_dir()``
+        pair. Callers that already hold a stat result (e.g. from a
+        ``DirEntry``) can pass ``st_mode`` to skip even that.
+        Returns None if ``p`` doesn't exist."""
+        if st_mode is None:
+            try:
+                st_mode = os.stat(p, follow_symlinks=False).st_mode
+            except OSError:
+                return None
+        if stat.S_ISREG(st_mode):
             return cls.FILE
-        if p.is_dir():
+        if stat.S_ISDIR(st_mode):
             return cls.DIR
         assert_not_exotic(p)
 
 
+class _MatchContext:
+    """Per-``match()``-traversal state: caches the ``FsTypeFlag`` of each
+    path so that the many levels/branches of the pattern tree that look at
+    the same ``full_path`` only cost one ``stat`` between them."""
+    __slots__ = ('_fs_type_cache',)
+
+    def __init__(self):
+        self._fs_type_cache: dict[Path, FsTypeFlag] = {}
+
+    def fs_type(self, p: Path) -> FsTypeFlag:
+        try:
+            return self._fs_type_cache[p]
+        except KeyError:
+            result = self._fs_type_cache[p] = FsTypeFlag.from_path(p)
+            return result
+
+    def add_known_fs_type(self, p: Path, fs_type: FsTypeFlag):
+        """Pre-seed the cache when the caller already knows the type
+        (e.g. from a ``DirEntry``) so even the first lookup is free."""
+        self._fs_type_cache[p] = fs_type
+
+
+def _fs_type_from_direntry(entry: os.DirEntry) -> FsTypeFlag | None:
+    """``FsTypeFlag`` from the type info ``os.scandir`` already cached on the
+    ``DirEntry`` - no syscall, unlike ``FsTypeFlag.from_path``.
+    Returns None for exotic entries (e.g. symlinks)."""
+    if entry.is_file(follow_symlinks=False):
+        return FsTypeFlag.FILE
+    if entry.is_dir(follow_symlinks=False):
+        return FsTypeFlag.DIR
+    return None
+
+
 FILE = FsTypeFlag.FILE
 DIR = FsTypeFlag.DIR
 
+_DIR_VALUE = FsTypeFlag.DIR.value
+
+_NEED_SLASH_FIX = os.sep == '\\'
+"""Only Windows paths can contain backslashes that need normalizing to
+'/' before comparing against pattern names - on POSIX the fix-up (and its
+per-component string copy) can be skipped entirely."""
+_SLASH_FIX_TABLE = str.maketrans('\\', '/')
+
+_TrieNode = tuple[int, 'dict[str, list[_TrieNode]] | None']
+"""``(fs_type_value, children_by_name)`` - ``children_by_name`` is None
+for a childless (leaf) pattern."""
+
+
+def _match_literal_trie(node: _TrieNode, parts: tuple[str, ...],
+                        full_path: Path, ctx: _MatchContext) -> bool:
+    """Walk a literal-name trie against ``parts`` (whose first component has
+    already been matched against the root node's name). This is the same DFS
+    as ``_match_iter`` runs for general patterns, but over plain
+    tuples/dicts, so a chain of SingleNamePatterns costs dict lookups and
+    int masks only."""
+    last = len(parts) - 1
+    stack = [(node, 0)]
+    while stack:
+        (fs_value, children_by_name), i = stack.pop()
+        if i == last:
+            # Final: literal patterns never match a null segment, so any
+            #  children at all mean this chain can't end here
+            if children_by_name is None:
+                actual = ctx.fs_type(full_path)
+                if actual is not None and fs_value & actual.value:
+                    return True
+            continue
+        if not fs_value & _DIR_VALUE:
+            continue
+        if children_by_name is None:
+            return True  # childless pattern matches the whole subtree
+        for sub in children_by_name.get(parts[i + 1], ()):
+            stack.append((sub, i + 1))
+    return False
+
 
 class AbstractPattern(ABC):
     """Represents any file/dir-matching pattern.
@@ -58,6 +144,18 @@ class AbstractPattern(ABC):
         #  the same but will need to be checked a TON
         self.children = children
         self.fs_type = self._get_fs_type(fs_type)
+        self._child_index: tuple[dict[str, list[AbstractPattern]],
+                                 list[AbstractPattern]] | None = None
+        # File-only leaves (the most common leaf by far) can answer the
+        #  final-component check with a single type comparison
+        self._is_trivial_file_leaf = self.fs_type == FsTypeFlag.FILE
+        # Raw int of fs_type: Flag.__and__ goes through member lookup on
+        #  every call, plain ints don't (used in the hot type check)
+        self._fs_type_value: int = self.fs_type.value
+        # All-literal subtrees get a trie of plain tuples/dicts that
+        #  _match_iter can walk without any method dispatch (set by
+        #  SingleNamePattern; None = subtree isn't purely literal)
+        self._literal_trie: _TrieNode | None = None
 
     def _get_fs_type(self, fs_type: FsTypeFlag = None):
         if fs_type is not None:
@@ -69,94 +167,227 @@ class AbstractPattern(ABC):
         return FsTypeFlag.BOTH
 
     # region list_files() et al.
-    def list_files(self, root: Path = None) -> list[Path]:
-        return self.list_subpaths_matching(root)
+    def list_files(self, root: Path = None,
+                   executor: Executor | None = None) -> list[Path]:
+        return self.list_subpaths_matching(root, executor)
 
-    def list_subpaths_matching(self, parent: Path | None) -> list[Path]:
+    def list_subpaths_matching(self, parent: Path | None,
+                               executor: Executor | None = None) -> list[Path]:
         """List all subpaths of ``parent`` matching ``self``.
 
         Here, parent is the directory above this and ``parent.iterdir()``
-        gives the candidates for ``self`` to match."""
+        gives the candidates for ``self`` to match.
+
+        If ``executor`` is given, the descents into the dirs matching
+        ``self`` run on it in parallel (the scandir syscalls release the
+        GIL, like the threaded walk in main.py)."""
         return self._find_all_subpaths_from_subpatterns(
             self._filter_allowed_fs_types(
                 self.list_subpaths_matching_self_or_root(parent)
-            )
+            ), executor
         )
 
-    def list_subpaths_matching_self_or_root(self, parent: Path | None) -> list[Path]:
+    _PathWithType = tuple[Path, 'FsTypeFlag']
+    """The self-matching methods return (path, fs_type) pairs so the fs type
+    learned from the DirEntry/stat travels with the path - downstream code
+    never has to re-stat just to re-learn the type."""
+
+    def list_subpaths_matching_self_or_root(
+            self, parent: Path | None) -> list[_PathWithType]:
         if parent is None:
             return self.list_files_from_root()
         return self.list_subpaths_matching_self(parent)
 
-    def list_files_from_root(self) -> list[Path]:
+    def list_files_from_root(self) -> list[_PathWithType]:
         raise TypeError("list_files_from_root must only be called on a root pattern")
 
-    def list_subpaths_matching_self(self, parent: Path) -> list[Path]:
-        """List all subpaths of ``parent`` matching ``self``,
-        not taking into account subpatterns/children.
-
-        This default implementation is inefficient,
-        listing all the files in the dir and checking if they match.
-        Implementors should provide a more efficient implementation if possible.
-
-        Here, parent is the directory above this and ``parent.iterdir()``
-        gives the candidates for ``self`` to match."""
-        return [p for p in parent.iterdir()
-                if self.has_allowed_fs_type(p)
-                and self.matches_self(p.relative_to(parent), full_path=p)]
+    def list_subpaths_matching_self(self, parent: Path) -> list[_PathWithType]:
+        """List all subpaths of ``parent`` matching ``self`` (as
+        ``(path, fs_type)`` pairs), not taking into account
+        subpatterns/children.
+
+        This default implementation lists all the entries in the dir and
+        checks if they match. Implementors should provide a more efficient
+        implementation if possible.
+
+        Here, parent is the directory above this and ``os.scandir(parent)``
+        gives the candidates for ``self`` to match. The fs-type check uses
+        the type info cached on the ``DirEntry`` (free, from ``readdir``)
+        rather than stat-ing each candidate, and the name to match is just
+        ``entry.name`` - no ``relative_to`` string-munging."""
+        result = []
+        with os.scandir(parent) as it:
+            for entry in it:
+                fs_type = _fs_type_from_direntry(entry)
+                if fs_type is None or not (self.fs_type & fs_type):
+                    continue
+                # Only entries of the right type get a Path allocated
+                p = Path(entry.path)
+                if self.matches_self(PurePath(entry.name), full_path=p):
+                    result.append((p, fs_type))
+        return result
 
     def _find_all_subpaths_from_subpatterns(  # This name is so long!
-            self, paths_matching_self: list[Path]) -> list[Path]:
-        return flatten([self._find_subpaths_of_from_subpatterns(p)
-                        for p in paths_matching_self])
-
-    def _find_subpaths_of_from_subpatterns(self, p: Path) -> list[Path]:
+            self, paths_matching_self: list[_PathWithType],
+            executor: Executor | None = None) -> list[Path]:
+        if executor is not None and len(paths_matching_self) > 1:
+            # Only this top fan-out submits to the executor - the descents
+            #  themselves run serially on the workers, so a task never waits
+            #  on another task (which could deadlock a saturated pool)
+            return flatten_lists(executor.map(
+                lambda p_t: self._find_subpaths_of_from_subpatterns(*p_t),
+                paths_matching_self))
+        # The inner results are always lists, so the flatten_lists fast path
+        #  applies (no per-element iterability probe)
+        return flatten_lists([self._find_subpaths_of_from_subpatterns(p, t)
+                              for p, t in paths_matching_self])
+
+    def _find_subpaths_of_from_subpatterns(
+            self, p: Path, fs_type: FsTypeFlag) -> list[Path]:
         if not self.children:
             return [p]
-        if p.is_file():
-            return [p] if self._subpatterns_match_final(p, p) else []
-        return flatten(sub.list_subpaths_matching(parent=p) for sub in self.children)
-
-    def _filter_allowed_fs_types(self, paths: list[Path]) -> list[Path]:
-        return [p for p in paths if self.has_allowed_fs_type(p)]
+        if fs_type == FsTypeFlag.FILE:  # Known from the scandir - no stat
+            ctx = _MatchContext()
+            ctx.add_known_fs_type(p, fs_type)
+            return [p] if self._subpatterns_match_final(p, p, ctx) else []
+        return flatten_lists(sub.list_subpaths_matching(parent=p)
+                             for sub in self.children)
+
+    def _filter_allowed_fs_types(
+            self, entries: list[_PathWithType]) -> list[_PathWithType]:
+        return [(p, t) for p, t in entries
+                if t is not None and self.fs_type & t]
     # endregion
 
     # region match() et al.
     def match(self, p: Path):
         assert p.is_absolute()
-        return self.matches_subpath(p, p)
+        return self._match_iter(p)
+
+    def _match_iter(self, full_path: Path) -> bool:
+        """Iterative (explicit work-stack) equivalent of the
+        ``matches_subpath`` recursion: pattern chains OR together, so the
+        first fully-matched chain wins and the rest of the stack is dropped.
+        Saves a Python frame per component per branch on deep paths.
+
+        Goes through the same overridable helpers as the recursive path
+        (``matches_self``, ``get_subpath``, ...), so subclasses behave
+        identically under both."""
+        ctx = _MatchContext()
+        stack: list[tuple[AbstractPattern, PurePath, tuple[str, ...]]] = [
+            (self, full_path, full_path.parts)]
+        while stack:
+            pattern, path, parts = stack.pop()
+            trie = pattern._literal_trie
+            if trie is not None:
+                # Purely-literal subtree: walk the precomputed trie in a
+                #  tight loop, no per-level method dispatch
+                comp = parts[0]
+                if comp is not pattern.name and comp != pattern.name and not (
+                        _NEED_SLASH_FIX and comp.translate(_SLASH_FIX_TABLE)
+                        == pattern.name):
+                    continue
+                if _match_literal_trie(trie, parts, full_path, ctx):
+                    return True
+                continue
+            if not pattern._is_valid_for_current_type(path, full_path, ctx, parts):
+                continue
+            if not pattern.matches_self(path, full_path):
+                continue
+            if len(parts) == 1:
+                if pattern._subpatterns_match_final(path, full_path, ctx):
+                    return True
+                continue
+            if not pattern.children:
+                return True
+            subpath = pattern.get_subpath(path, parts)
+            subparts = parts[1:]
+            literal_by_name, fallback = pattern._get_child_index()
+            component = (subparts[0].translate(_SLASH_FIX_TABLE)
+                         if _NEED_SLASH_FIX else subparts[0])
+            for ch in fallback:
+                stack.append((ch, subpath, subparts))
+            for ch in literal_by_name.get(component, ()):
+                stack.append((ch, subpath, subparts))
+        return False
 
-    def matches_subpath(self, path: PurePath, full_path: Path) -> bool:
+    def matches_subpath(self, path: PurePath, full_path: Path,
+                        ctx: _MatchContext | None = None,
+                        parts: tuple[str, ...] | None = None) -> bool:
+        if ctx is None:
+            ctx = _MatchContext()
+        if parts is None:
+            # PurePath.parts builds a fresh tuple on every access, so derive
+            #  it once here and thread it down through the recursion
+            parts = path.parts
         # Wow, this is so readable!
-        return (self._is_valid_for_current_type(path, full_path)
+        return (self._is_valid_for_current_type(path, full_path, ctx, parts)
                 and self.matches_self(path, full_path)
-                and self._subpatterns_match(path, full_path))
+                and self._subpatterns_match(path, full_path, ctx, parts))
 
     @abstractmethod
     def matches_self(self, path: PurePath, full_path: Path) -> bool:
         ...
 
-    def _is_valid_for_current_type(self, path: PurePath, full_path: Path):
-        actual_type_flag = (FsTypeFlag.DIR if not self.is_final_component(path)
-                            else FsTypeFlag.from_path(full_path))
-        return self.fs_type & actual_type_flag
+    def _is_valid_for_current_type(self, path: PurePath, full_path: Path,
+                                   ctx: _MatchContext, parts: tuple[str, ...]):
+        if len(parts) != 1:  # not final => must be a dir
+            return self._fs_type_value & _DIR_VALUE
+        actual = ctx.fs_type(full_path)
+        return actual is not None and self._fs_type_value & actual.value
 
-    def _subpatterns_match(self, path: PurePath, full_patch: Path):
+    def _subpatterns_match(self, path: PurePath, full_patch: Path,
+                           ctx: _MatchContext, parts: tuple[str, ...]):
         return (
-            self._subpatterns_match_final(path, full_patch) if self.is_final_component(path)
-            else self._subpatterns_match_path(path, full_patch))
+            self._subpatterns_match_final(path, full_patch, ctx)
+            if len(parts) == 1
+            else self._subpatterns_match_path(path, full_patch, ctx, parts))
 
-    def _subpatterns_match_path(self, path, full_path):
+    def _subpatterns_match_path(self, path, full_path, ctx: _MatchContext,
+                                parts: tuple[str, ...]):
         if not self.children:
             return True
-        subpath = self.get_subpath(path)
-        for ch in self.children:
-            if ch.matches_subpath(subpath, full_path):
+        subpath = self.get_subpath(path, parts)
+        subparts = parts[1:]
+        literal_by_name, fallback = self._get_child_index()
+        # A literal child can only match if its name equals the next
+        #  component, so one dict lookup replaces scanning all of them.
+        component = (subparts[0].translate(_SLASH_FIX_TABLE)
+                     if _NEED_SLASH_FIX else subparts[0])
+        for ch in literal_by_name.get(component, ()):
+            if ch.matches_subpath(subpath, full_path, ctx, subparts):
+                return True
+        for ch in fallback:
+            if ch.matches_subpath(subpath, full_path, ctx, subparts):
                 return True
         return False
 
-    def _subpatterns_match_final(self, _path: PurePath, full_path: Path):
-        return (self.has_allowed_fs_type(full_path)
+    def _get_child_index(self):
+        if self._child_index is None:
+            self._child_index = self._build_child_index()
+        return self._child_index
+
+    def _build_child_index(self):
+        """Split ``children`` into exact-name patterns (indexed by name) and
+        everything else (always tried). Built lazily: patterns used only for
+        listing never pay for it."""
+        literal_by_name: dict[str, list[AbstractPattern]] = {}
+        fallback: list[AbstractPattern] = []
+        for ch in self.children:
+            # Exact type check: subclasses may override matching behavior
+            if type(ch) is SingleNamePattern:
+                literal_by_name.setdefault(ch.name, []).append(ch)
+            else:
+                fallback.append(ch)
+        return literal_by_name, fallback
+
+    def _subpatterns_match_final(self, _path: PurePath, full_path: Path,
+                                 ctx: _MatchContext):
+        if self._is_trivial_file_leaf:
+            # FILE-only implies no children (asserted in _get_fs_type), so
+            #  the whole check collapses to 'is it actually a file?'
+            return ctx.fs_type(full_path) == FsTypeFlag.FILE
+        return (self.fs_type & ctx.fs_type(full_path)
                 and (len(self.children) == 0
                      or self._any_child_matches_null()))
 
@@ -174,9 +405,13 @@ class AbstractPattern(ABC):
     # Not static so that is can be overridden by 'shortcut' matchers
     #  (i.e. matchers matching multiple levels)
     # noinspection PyMethodMayBeStatic
-    def get_subpath(self, path: PurePath):
-        # Relative to first inner dir = remove first dir, then return
-        return path.relative_to(Path(*path.parts[:1]))
+    def get_subpath(self, path: PurePath,
+                    parts: tuple[str, ...] | None = None):
+        # Remove first dir by slicing the parts tuple - relative_to would
+        #  build a throwaway Path and walk both paths to compare them
+        if parts is None:
+            parts = path.parts
+        return PurePath(*parts[1:])
 
     @classmethod
     def is_final_component(cls, path: PurePath):
@@ -188,7 +423,11 @@ class AbstractPattern(ABC):
 
     # noinspection PyMethodMayBeStatic
     def current_component(self, path: PurePath):
-        return path.parts[0].replace('\\', '/')
+        if _NEED_SLASH_FIX:
+            # translate with a precomputed table beats replace() here as
+            #  it doesn't rescan for the (usually absent) pattern
+            return path.parts[0].translate(_SLASH_FIX_TABLE)
+        return path.parts[0]
     # endregion
 
 
@@ -199,15 +438,65 @@ class SingleNamePattern(AbstractPattern):
         if fs_type is None and name.endswith('/'):
             fs_type = FsTypeFlag.DIR
             name = name.removesuffix('/')
-        self.name = name
+        # Interned so comparisons against other interned strings (e.g.
+        #  components of paths Python parsed itself) are pointer checks
+        self.name = sys.intern(name)
         super().__init__(fs_type, children)
+        self._literal_trie = self._build_literal_trie()
 
-    def matches_self(self, path: PurePath, full_path: Path) -> bool:
-        return self.current_component(path) == self.name
+    def _build_literal_trie(self) -> _TrieNode | None:
+        """Patterns are built bottom-up, so the children's tries (if any)
+        already exist and each node is only ever built once."""
+        if not self.children:
+            return self._fs_type_value, None
+        children_by_name: dict[str, list[_TrieNode]] = {}
+        for ch in self.children:
+            # Exact type check (as in _build_child_index): subclasses may
+            #  override matching behavior, which a trie can't represent
+            if type(ch) is not SingleNamePattern or ch._literal_trie is None:
+                return None
+            children_by_name.setdefault(ch.name, []).append(ch._literal_trie)
+        return self._fs_type_value, children_by_name
 
-    def list_subpaths_matching_self(self, parent: Path) -> list[Path]:
+    def matches_self(self, path: PurePath, full_path: Path) -> bool:
+        # Compare parts[0] directly - going via current_component would copy
+        #  the string through the slash fix-up even when it can't differ
+        comp = path.parts[0]
+        # `is` hits first for interned components - full compare otherwise
+        if comp is self.name or comp == self.name:
+            return True
+        # Only a Windows anchor ('C:\\') can actually contain a backslash
+        return _NEED_SLASH_FIX and comp.translate(_SLASH_FIX_TABLE) == self.name
+
+    def matches_subpath(self, path: PurePath, full_path: Path,
+                        ctx: _MatchContext | None = None,
+                        parts: tuple[str, ...] | None = None) -> bool:
+        if self.children:
+            return super().matches_subpath(path, full_path, ctx, parts)
+        # Childless leaf (the bulk of matches_subpath calls): the whole
+        #  check is one name compare + one type mask, no helper chain
+        if parts is None:
+            parts = path.parts
+        comp = parts[0]
+        if not (comp is self.name or comp == self.name or (
+                _NEED_SLASH_FIX
+                and comp.translate(_SLASH_FIX_TABLE) == self.name)):
+            return False
+        if len(parts) != 1:
+            # Childless pattern matches the whole subtree below a dir
+            return bool(self._fs_type_value & _DIR_VALUE)
+        actual = (ctx.fs_type(full_path) if ctx is not None
+                  else FsTypeFlag.from_path(full_path))
+        return actual is not None and bool(self._fs_type_value & actual.value)
+
+    def list_subpaths_matching_self(
+            self, parent: Path) -> list[AbstractPattern._PathWithType]:
         sub = parent / self.name
-        return [sub] if sub.exists() and self.fs_type & FsTypeFlag.from_path(sub) else []
+        # from_path gives None if missing, so no .exists() pre-check (= stat)
+        sub_type = FsTypeFlag.from_path(sub)
+        if sub_type is not None and self.fs_type & sub_type:
+            return [(sub, sub_type)]
+        return []
 
 
 class RootPattern(AbstractPattern):
@@ -218,7 +507,8 @@ class RootPattern(AbstractPattern):
         path = Path(path)
         assert path.is_dir()
         assert path.is_absolute()
-        assert len(path.parts) == 0
+        # A bare root is exactly one part ('/' or 'C:\\'), not zero
+        assert len(path.parts) == 1
         self.root = path
         self.root_str = self.root.as_posix()
         super().__init__(FsTypeFlag.DIR, children)
@@ -227,5 +517,9 @@ class RootPattern(AbstractPattern):
         assert path == full_path, "RootPattern must be at the bottom of the pattern tree."
         return self.current_component(path) == self.root_str
 
-    def list_files_from_root(self) -> list[Path]:
-        return list(self.root.iterdir())
+    def list_files_from_root(self) -> list[AbstractPattern._PathWithType]:
+        # scandir gives the fs type of each entry for free (iterdir would
+        #  cost an extra stat per entry to re-learn it)
+        with os.scandir(self.root) as it:
+            return [(Path(entry.path), _fs_type_from_direntry(entry))
+                    for entry in it]
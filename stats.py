@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-import shutil
-import warnings
+import os
+from array import array
 from pathlib import Path
+from typing import Iterable
 
 
 class Stats:
@@ -12,16 +13,36 @@ class Stats:
         # These only include the files (du of dirs would give excluded as well)
         self.bytes_to_copy_ls = 0
         self.bytes_to_copy_du = 0
-        self._size_cache: dict[Path, tuple[int, int]] = {}
+        # One str->slot dict plus two parallel int64 arrays: the sizes live
+        #  as 8-byte machine ints (16B/file) instead of two boxed Python
+        #  ints per file, and there's a single dict to hash into
+        self._size_index: dict[str, int] = {}
+        self._size_ls = array('q')
+        self._size_du = array('q')
 
     def lookup_sizes(self, file: Path):
+        key = os.fspath(file)
         try:
-            result = self._size_cache[file]
+            i = self._size_index[key]
         except KeyError:
-            warnings.warn("File not found in cache - this will give "
-                          "wrong results if file is changed")
-            result = self._size_cache[file] = self._calc_size(file)
-        return result
+            # Not pre-seeded from the walk's DirEntry.stat (e.g. a direct
+            #  file include) - stat it here, once, and cache it
+            sizes = self._calc_size(file)
+            self._store_sizes(key, sizes)
+            return sizes
+        return self._size_ls[i], self._size_du[i]
+
+    def _store_sizes(self, key: str, sizes: tuple[int, int]):
+        # Re-storing a known file updates its slot in place (keeps the
+        #  cache fresh without orphaning array entries). No mtime in the
+        #  key: the sizes come from the same stat that an mtime check
+        #  would need, so invalidating on mtime couldn't save a syscall.
+        i = self._size_index.setdefault(key, len(self._size_ls))
+        if i == len(self._size_ls):
+            self._size_ls.append(sizes[0])
+            self._size_du.append(sizes[1])
+        else:
+            self._size_ls[i], self._size_du[i] = sizes
 
     def _add_to_totals(self, sizes: tuple[int, int]):
         self.bytes_to_copy_ls += sizes[0]
@@ -33,12 +54,48 @@ class Stats:
 
     @classmethod
     def _calc_size(cls, file: Path):
-        return file.stat().st_size, shutil.disk_usage(file).used
+        return cls._sizes_from_stat(file.stat())
+
+    @classmethod
+    def _sizes_from_stat(cls, st: os.stat_result):
+        # st_blocks is the actual allocated size (in 512-byte units, POSIX
+        #  only) - sparse/compressed files may use less than st_size.
+        # (This replaced a per-file shutil.disk_usage call: that was a
+        #  statvfs of the whole *volume* per file - even cached per-mount it
+        #  could only ever report mount-level, not per-file, usage.)
+        du = st.st_blocks * 512 if hasattr(st, 'st_blocks') else st.st_size
+        return st.st_size, du
 
-    def add_file(self, file: Path):
+    def add_file(self, file: Path, st: os.stat_result | None = None):
+        if st is not None:
+            self._store_sizes(os.fspath(file), self._sizes_from_stat(st))
         self.n_files += 1
         self._add_to_totals(self.lookup_sizes(file))
 
+    def add_files(self, files_with_st: Iterable[tuple[Path, os.stat_result]]):
+        """Batch version of ``add_file``: accumulates in locals and touches
+        the counter/total attributes once per batch instead of 3x per file.
+
+        Files must not already be in the cache (the walk de-dups against
+        ``known_files`` before calling this) - that lets this skip the
+        slot-reuse check ``_store_sizes`` does."""
+        n = total_ls = total_du = 0
+        index, size_ls, size_du = self._size_index, self._size_ls, self._size_du
+        append_ls, append_du = size_ls.append, size_du.append
+        sizes_from_stat = self._sizes_from_stat
+        fspath = os.fspath
+        for file, st in files_with_st:
+            ls, du = sizes_from_stat(st)
+            index[fspath(file)] = len(size_ls)
+            append_ls(ls)
+            append_du(du)
+            n += 1
+            total_ls += ls
+            total_du += du
+        self.n_files += n
+        self.bytes_to_copy_ls += total_ls
+        self.bytes_to_copy_du += total_du
+
     def remove_file(self, file: Path):
         self.n_files -= 1
         self._sub_from_totals(self.lookup_sizes(file))